@@ -7,8 +7,11 @@ import pandas as pd
 import requests
 from django.conf import settings
 from django.core.management.base import BaseCommand
+from django.db import connection
 from google.cloud import bigquery
 
+from astronomy.services import SPACE_WEATHER_CHANNEL
+
 # -----------------------------
 # Constants
 # -----------------------------
@@ -105,10 +108,28 @@ class Command(BaseCommand):
 
             self.stdout.write(self.style.SUCCESS(f"Successfully loaded data to {table_ref}"))
 
+            # --- 5. 配信中の Web プロセスへ通知 (PostgreSQL の場合のみ) ---
+            self.notify_ingested()
+
         except Exception as e:
             self.stdout.write(self.style.ERROR(f"Error during ingestion: {e}"))
             sys.exit(1)
 
+    def notify_ingested(self):
+        """
+        SpaceWeatherHub が LISTEN しているチャンネルへ NOTIFY を送り、
+        ポーリング間隔を待たずに差分を取り込ませる。
+        """
+        if connection.vendor != "postgresql":
+            return
+
+        try:
+            with connection.cursor() as cursor:
+                cursor.execute(f"NOTIFY {SPACE_WEATHER_CHANNEL}")
+        except Exception as e:
+            # 通知に失敗してもデータはロード済みなので、警告のみとする
+            self.stdout.write(self.style.WARNING(f"Failed to notify ingestion: {e}"))
+
 
 # -----------------------------
 # Helper Functions
@@ -1,12 +1,25 @@
+import json
+import logging
 import os
-from datetime import datetime
+import queue
+import threading
+import time
+import uuid
+from collections.abc import Iterator
+from datetime import datetime, timedelta
 from zoneinfo import ZoneInfo
 
+import numpy as np
+import pandas as pd
 from django.conf import settings
+from django.db import connections
+from google.cloud import bigquery
 from skyfield.api import Loader
 from skyfield.framelib import ecliptic_frame
 from skyfield.timelib import Time
 
+logger = logging.getLogger(__name__)
+
 # シングルトン的にデータを保持（再起動までメモリに載せる）
 _TS = None
 _EPH = None
@@ -47,6 +60,9 @@ class OrbitalCalculator:
         "pluto": "pluto barycenter",
     }
 
+    # ストリーミング時に1チャンクで計算するデータ点数
+    STREAM_CHUNK_SIZE = 1000
+
     def __init__(self):
         self.ts, self.eph = _get_resources()
         self.sun = self.eph["sun"]
@@ -57,18 +73,46 @@ class OrbitalCalculator:
         各ステップにおける全惑星の (x, y) 座標 [AU] を計算して返す。
         座標系: 太陽中心・黄道座標 (Ecliptic J2000)
         """
+        t_start, t_end = self._to_skyfield_range(start_dt, end_dt)
+
+        # ベクトル計算用の Time オブジェクト生成
+        times: Time = self.ts.linspace(t_start, t_end, steps)
+
+        return self._positions_at(times)
+
+    def iter_positions(
+        self, start_dt: datetime, end_dt: datetime, steps: int = 100, chunk_size: int | None = None
+    ) -> Iterator[dict]:
+        """
+        calculate_positions と同じ結果を chunk_size 点ずつに分けて順に返すジェネレータ。
+        各チャンクは {"timestamps": [...], "bodies": {...}} 形式。
+        全期間の Time 配列を一度に作らないため、steps に関わらずメモリ使用量は一定。
+        """
+        chunk_size = chunk_size or self.STREAM_CHUNK_SIZE
+        t_start, t_end = self._to_skyfield_range(start_dt, end_dt)
+
+        # ts.linspace と同じく whole + fraction で精度を保ったまま等間隔に分割する
+        span = (t_end.whole - t_start.whole) + (t_end.tt_fraction - t_start.tt_fraction)
+        denom = max(steps - 1, 1)
+
+        for offset in range(0, steps, chunk_size):
+            idx = np.arange(offset, min(offset + chunk_size, steps))
+            times: Time = self.ts.tt_jd(t_start.whole, t_start.tt_fraction + span * idx / denom)
+            yield self._positions_at(times)
+
+    def _to_skyfield_range(self, start_dt: datetime, end_dt: datetime) -> tuple[Time, Time]:
         # UTCに統一
         if start_dt.tzinfo is None:
             start_dt = start_dt.replace(tzinfo=ZoneInfo("UTC"))
         if end_dt.tzinfo is None:
             end_dt = end_dt.replace(tzinfo=ZoneInfo("UTC"))
 
-        t_start = self.ts.from_datetime(start_dt)
-        t_end = self.ts.from_datetime(end_dt)
-
-        # ベクトル計算用の Time オブジェクト生成
-        times: Time = self.ts.linspace(t_start, t_end, steps)
+        return self.ts.from_datetime(start_dt), self.ts.from_datetime(end_dt)
 
+    def _positions_at(self, times: Time) -> dict:
+        """
+        与えられた時刻配列における全惑星の (x, y) 座標 [AU] を計算する。
+        """
         result_bodies = {}
 
         # 惑星ごとに計算
@@ -97,3 +141,493 @@ class OrbitalCalculator:
             "timestamps": [t.utc_iso() for t in times],
             "bodies": result_bodies,
         }
+
+
+# ---------------------------------------------------------
+# 宇宙天気 (Space Weather)
+# ---------------------------------------------------------
+SPACE_WEATHER_TABLE = "celestial_biome_data.space_weather_metrics"
+SPACE_WEATHER_WINDOW = timedelta(days=7)
+
+# ingest_space_weather が取り込み完了時に NOTIFY するチャンネル名
+SPACE_WEATHER_CHANNEL = "space_weather"
+
+
+def fetch_space_weather(since: datetime | None = None) -> pd.DataFrame:
+    """
+    BigQueryから宇宙天気データ (timestamp, metric, value) を取得する。
+    since 指定時はその時刻以降の行、未指定時は直近7日間を返す。
+    """
+    client = bigquery.Client()
+
+    if since is None:
+        where = "timestamp >= TIMESTAMP_SUB(CURRENT_TIMESTAMP(), INTERVAL 7 DAY)"
+        params = []
+    else:
+        where = "timestamp >= @since"
+        params = [bigquery.ScalarQueryParameter("since", "TIMESTAMP", since)]
+
+    query = f"""
+        SELECT timestamp, metric, value
+        FROM `{settings.GOOGLE_CLOUD_PROJECT}.{SPACE_WEATHER_TABLE}`
+        WHERE {where}
+        ORDER BY timestamp ASC
+    """
+    job_config = bigquery.QueryJobConfig(query_parameters=params)
+    return client.query(query, job_config=job_config).result().to_dataframe()
+
+
+SPACE_WEATHER_METRICS = ("xray_flux", "solar_wind_speed", "imf_bz", "kp_index")
+
+
+def pivot_space_weather(df: pd.DataFrame, last_kp: float | None = None) -> tuple[np.ndarray, np.ndarray]:
+    """
+    Long Format (timestamp, metric, value) を Wide Format に変換し、
+    (時刻 [UTCエポックns, int64], 指標値 [float64, shape=(n, len(SPACE_WEATHER_METRICS))]) を返す。
+    last_kp を渡すと、先頭の Kp 指数の欠損をその値で埋める (差分取り込み用)。
+    """
+    if df.empty:
+        return np.empty(0, dtype=np.int64), np.empty((0, len(SPACE_WEATHER_METRICS)))
+
+    # 1. 重複排除: 同じ時刻・同じ指標なら平均をとる
+    df = df.groupby(["timestamp", "metric"])["value"].mean().reset_index()
+
+    # 2. Pivot: 行=時刻, 列=指標, 値=value (列の並びは SPACE_WEATHER_METRICS に固定)
+    pivoted = df.pivot(index="timestamp", columns="metric", values="value")
+    pivoted = pivoted.reindex(columns=list(SPACE_WEATHER_METRICS)).astype(float)
+
+    if last_kp is not None and pd.isna(pivoted["kp_index"].iloc[0]):
+        pivoted.loc[pivoted.index[0], "kp_index"] = last_kp
+    # Kp指数は3時間ごとなので、間の1分刻みのデータは直前の値で埋める(ffill)
+    # データの先頭がnullの場合に備えて0埋め等はせず、描画時に任せます
+    pivoted["kp_index"] = pivoted["kp_index"].ffill()
+
+    timestamps = pd.DatetimeIndex(pivoted.index).as_unit("ns").asi8
+    return timestamps, pivoted.to_numpy(dtype=np.float64)
+
+
+def to_space_weather_records(timestamps: np.ndarray, values: np.ndarray, valid: np.ndarray) -> list[dict]:
+    """
+    SpaceWeatherBuffer の列データを、グラフ描画用の1時刻1レコードのリストに変換する。
+    欠損値は None (JSONのnull) になる。
+    """
+    # timestampを文字列(ISO format)に変換 (JSON化のため)
+    isos = np.datetime_as_string(timestamps.astype("datetime64[ns]"), unit="s").tolist()
+
+    # NaN (欠損値) を None に置換 (JSONのnullになる)
+    cells = values.astype(object)
+    cells[~valid] = None
+
+    return [
+        {"timestamp": f"{iso}+00:00", **dict(zip(SPACE_WEATHER_METRICS, row, strict=True))}
+        for iso, row in zip(isos, cells.tolist(), strict=True)
+    ]
+
+
+def dump_space_weather(timestamps: np.ndarray, values: np.ndarray, valid: np.ndarray) -> str:
+    """to_space_weather_records の結果を JSON 文字列にする。"""
+    return json.dumps(to_space_weather_records(timestamps, values, valid), separators=(",", ":"))
+
+
+class SpaceWeatherBuffer:
+    """
+    直近の宇宙天気データを保持する固定長のリングバッファ。
+    時刻 (int64, UTCエポックns) と各指標 (float64) を列ごとの配列で持ち、欠損は valid マスクで表す。
+    配列を2倍長で確保し各点を i と i + capacity の両方に書き込むため、
+    保持中のデータは常に連続した領域になり、範囲取得はコピーなしのスライスで済む。
+    """
+
+    # 1分間隔で7日分 + 余裕
+    CAPACITY = 7 * 24 * 60 + 1024
+
+    def __init__(self, capacity: int | None = None):
+        self.capacity = capacity or self.CAPACITY
+        self._timestamps = np.zeros(2 * self.capacity, dtype=np.int64)
+        self._values = np.full((2 * self.capacity, len(SPACE_WEATHER_METRICS)), np.nan)
+        self._valid = np.zeros((2 * self.capacity, len(SPACE_WEATHER_METRICS)), dtype=bool)
+        # 各点が最後に変化した世代 (Last-Event-ID からの再開用)
+        self._generations = np.zeros(2 * self.capacity, dtype=np.int64)
+        self._next = 0
+        self._size = 0
+        # 内容が変わるたびに増える世代番号 (シリアライズ結果のキャッシュ判定用)
+        self.generation = 0
+
+    def __len__(self) -> int:
+        return self._size
+
+    @property
+    def last_timestamp(self) -> int | None:
+        if not self._size:
+            return None
+        return int(self._timestamps[self._next + self.capacity - 1])
+
+    def value_before(self, timestamp: int, metric: str) -> float | None:
+        """timestamp より前で最も新しい点における metric の値。該当する点がないか欠損なら None。"""
+        timestamps, values, valid = self.window(end=timestamp - 1)
+        if not len(timestamps):
+            return None
+        j = SPACE_WEATHER_METRICS.index(metric)
+        return float(values[-1, j]) if valid[-1, j] else None
+
+    def merge(self, timestamps: np.ndarray, values: np.ndarray) -> np.ndarray:
+        """
+        時刻順に並んだデータ点をバッファに反映し、内容が変わった点の位置 (window() 上の添字) を返す。
+        既に保持している時刻には欠損でない指標だけを上書きし、新しい時刻は時刻順を保って挿入する。
+        容量を超えた分は古い点から捨てられる。
+        """
+        if not len(timestamps):
+            return np.empty(0, dtype=np.intp)
+
+        # 反映する最古の時刻より前の点はそのまま残し、それ以降だけを作り直す
+        current, current_values, current_valid = self.window()
+        lo = int(np.searchsorted(current, timestamps[0], side="left"))
+        old_timestamps = current[lo:].copy()
+        old_values = current_values[lo:].copy()
+        old_valid = current_valid[lo:].copy()
+        begin = (self._next - self._size) % self.capacity
+        old_generations = self._generations[begin + lo : begin + self._size].copy()
+
+        merged = np.union1d(old_timestamps, timestamps)
+        merged_values = np.full((len(merged), len(SPACE_WEATHER_METRICS)), np.nan)
+        merged_valid = np.zeros((len(merged), len(SPACE_WEATHER_METRICS)), dtype=bool)
+
+        old_rows = np.searchsorted(merged, old_timestamps)
+        merged_values[old_rows] = old_values
+        merged_valid[old_rows] = old_valid
+
+        # 新しい点は欠損でない指標だけを上書きする
+        new_rows, new_cols = np.nonzero(~np.isnan(values))
+        target_rows = np.searchsorted(merged, timestamps)[new_rows]
+        merged_values[target_rows, new_cols] = values[new_rows, new_cols]
+        merged_valid[target_rows, new_cols] = True
+
+        # 変化した点: 新しく挿入された点、または欠損の有無・値が変わった点
+        changed = np.ones(len(merged), dtype=bool)
+        kept_valid = merged_valid[old_rows]
+        changed[old_rows] = (kept_valid != old_valid).any(axis=1) | (
+            kept_valid & old_valid & (merged_values[old_rows] != old_values)
+        ).any(axis=1)
+        if not changed.any():
+            return np.empty(0, dtype=np.intp)
+
+        self.generation += 1
+        merged_generations = np.full(len(merged), self.generation, dtype=np.int64)
+        merged_generations[old_rows] = np.where(changed[old_rows], self.generation, old_generations)
+
+        # lo 以降を切り詰めてから、作り直した点を書き込む
+        self._next = (self._next - (self._size - lo)) % self.capacity
+        self._size = lo
+        self._append(merged, merged_values, merged_valid, merged_generations)
+
+        dropped = max(lo + len(merged) - self.capacity, 0)
+        positions = lo + np.flatnonzero(changed) - dropped
+        return positions[positions >= 0]
+
+    def _append(self, timestamps: np.ndarray, values: np.ndarray, valid: np.ndarray, generations: np.ndarray) -> None:
+        # 容量を超える分は、どのみち上書きされるので書き込まない
+        n = min(len(timestamps), self.capacity)
+        timestamps, values, valid, generations = timestamps[-n:], values[-n:], valid[-n:], generations[-n:]
+        positions = (self._next + np.arange(n)) % self.capacity
+        for offset in (0, self.capacity):
+            self._timestamps[positions + offset] = timestamps
+            self._values[positions + offset] = values
+            self._valid[positions + offset] = valid
+            self._generations[positions + offset] = generations
+
+        self._next = (self._next + len(timestamps)) % self.capacity
+        self._size = min(self._size + len(timestamps), self.capacity)
+
+    def changed_since(self, generation: int) -> np.ndarray:
+        """generation より後に内容が変わった点の位置 (window() 上の添字) を返す。"""
+        begin = (self._next - self._size) % self.capacity
+        return np.flatnonzero(self._generations[begin : begin + self._size] > generation)
+
+    def window(self, start: int | None = None, end: int | None = None) -> tuple[np.ndarray, np.ndarray, np.ndarray]:
+        """
+        start <= timestamp <= end [UTCエポックns] の範囲を (timestamps, values, valid) で返す。
+        いずれも内部配列のビューなので、次の merge までに使い終えること。
+        """
+        begin = (self._next - self._size) % self.capacity
+        timestamps = self._timestamps[begin : begin + self._size]
+
+        lo = 0 if start is None else int(np.searchsorted(timestamps, start, side="left"))
+        hi = self._size if end is None else int(np.searchsorted(timestamps, end, side="right"))
+        rows = slice(begin + lo, begin + hi)
+        return self._timestamps[rows], self._values[rows], self._valid[rows]
+
+
+class TooManyStreamsError(Exception):
+    """SSE の同時接続数が SPACE_WEATHER_MAX_STREAMS に達している。"""
+
+
+class SpaceWeatherUnavailableError(Exception):
+    """宇宙天気データを一度も読み込めていない。"""
+
+
+class SpaceWeatherSubscription:
+    """
+    SpaceWeatherHub の購読者1件分。最初に snapshot (直近7日分の JSON) か
+    resume (Last-Event-ID 以降に変化したデータ点の JSON) のどちらかを送り、
+    以降に変化したデータ点は (イベントID, JSON) としてキューに届く。
+    配信が追いつかずキューが溢れた場合は closed になり、クライアントに再接続させる。
+    """
+
+    MAX_PENDING = 100
+
+    def __init__(self, event_id: str):
+        # 最初に送るイベントの ID (登録時点の世代)
+        self.event_id = event_id
+        self.snapshot: str | None = None
+        self.resume: str | None = None
+        self.queue: queue.Queue[tuple[str, str]] = queue.Queue(maxsize=self.MAX_PENDING)
+        self.closed = False
+
+    def get(self, timeout: float) -> tuple[str, str]:
+        """新しいデータ点を待つ。timeout 秒以内に届かなければ queue.Empty を送出する。"""
+        return self.queue.get(timeout=timeout)
+
+    def push(self, event_id: str, points: str) -> None:
+        try:
+            self.queue.put_nowait((event_id, points))
+        except queue.Full:
+            self.closed = True
+
+
+class SpaceWeatherHub:
+    """
+    宇宙天気データのプロセス内キャッシュ兼ファンアウト。
+    直近のデータを SpaceWeatherBuffer に保持し、バックグラウンドスレッド1本だけが
+    BigQuery に差分を問い合わせてバッファに反映し、変化したデータ点を全購読者に配信する。
+    PostgreSQL 利用時は ingest_space_weather の NOTIFY を LISTEN し、通知があったときだけ取り込む。
+    それ以外 (SQLite等) では POLL_INTERVAL 秒ごとのポーリングになる。
+    購読者がおらず IDLE_TIMEOUT 秒アクセスがなければスレッドは止まり、次のアクセスで再開する。
+    BigQuery への問い合わせはすべてスレッド側で行い、リクエストは保持中のデータをそのまま返す。
+    """
+
+    POLL_INTERVAL = 60
+    IDLE_TIMEOUT = 600
+    # PostgreSQL で NOTIFY が届かなくても、この秒数ごとには読み直す (通知の取りこぼし対策)
+    FALLBACK_INTERVAL = 30 * 60
+    # バッファが一度も埋まっていないとき、リクエスト側が初回の読み込みを待つ最大秒数
+    LOAD_TIMEOUT = 30
+
+    # 毎回この期間だけ遡って読み直す。指標ごとに取り込みの遅れが異なり
+    # (Kp指数は3時間ごとの時刻で後から届く)、最新時刻より古い行も後から追加されるため
+    OVERLAP = timedelta(hours=6)
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        # イベントIDの接頭辞。別プロセス・再起動前の世代番号を区別する
+        self._instance = uuid.uuid4().hex[:8]
+        self._subscribers: list[SpaceWeatherSubscription] = []
+        self._buffer = SpaceWeatherBuffer()
+        self._thread: threading.Thread | None = None
+        self._last_access = 0.0
+        # スレッド起動後、最初の読み込みを試み終えたら set される
+        self._attempted = threading.Event()
+        self._loaded = False
+        self._last_error: Exception | None = None
+        self._last_refresh = 0.0
+        # 直近7日分の JSON。バッファの世代が変わるまで使い回す
+        self._payload: str | None = None
+        self._payload_generation = -1
+
+    def recent(self) -> str:
+        """直近7日間のデータ点を JSON 文字列で返す。"""
+        self._ensure_loaded()
+        with self._lock:
+            snapshot = self._snapshot()
+        return self._serialize(snapshot)
+
+    def subscribe(self, last_event_id: str | None = None) -> SpaceWeatherSubscription:
+        """
+        購読を開始する。last_event_id から再開できれば、それ以降に変化したデータ点だけを resume に、
+        できなければ (別プロセスや再起動前の ID など) 直近7日分を snapshot に入れて返す。
+        以降に変化したデータ点は取りこぼし・重複なくキューに届く。
+        同時接続数が上限に達している場合は TooManyStreamsError を送出する。
+        """
+        self._ensure_loaded()
+        with self._lock:
+            if len(self._subscribers) >= settings.SPACE_WEATHER_MAX_STREAMS:
+                raise TooManyStreamsError("Too many space weather streams")
+            subscription = SpaceWeatherSubscription(self._event_id())
+            since = self._resume_generation(last_event_id)
+            if since is None:
+                snapshot = self._snapshot()
+            else:
+                changed = self._buffer.changed_since(since)
+                columns = tuple(column[changed] for column in self._buffer.window())
+            self._subscribers.append(subscription)
+
+        if since is None:
+            subscription.snapshot = self._serialize(snapshot)
+        elif len(changed):
+            subscription.resume = dump_space_weather(*columns)
+        return subscription
+
+    def unsubscribe(self, subscription: SpaceWeatherSubscription) -> None:
+        with self._lock:
+            if subscription in self._subscribers:
+                self._subscribers.remove(subscription)
+
+    def _ensure_loaded(self) -> None:
+        """
+        取り込み監視スレッドが止まっていれば起動する。停止中の差分はスレッド側で読み込むので、
+        ここでは待たずに保持中のデータを使わせる。一度も読み込めていない場合のみ
+        初回の読み込みを待ち、それでも失敗していれば SpaceWeatherUnavailableError を送出する。
+        """
+        with self._lock:
+            self._last_access = time.monotonic()
+            if self._thread is None or not self._thread.is_alive():
+                self._attempted = threading.Event()
+                self._thread = threading.Thread(
+                    target=self._run, args=(self._attempted,), name="space-weather-hub", daemon=True
+                )
+                self._thread.start()
+            if self._loaded:
+                return
+            attempted = self._attempted
+
+        attempted.wait(self.LOAD_TIMEOUT)
+        with self._lock:
+            if not self._loaded:
+                raise SpaceWeatherUnavailableError(f"Space weather data is not available: {self._last_error}")
+
+    def _event_id(self) -> str:
+        """現在の世代を表す SSE のイベントID。呼び出し側で _lock を保持していること。"""
+        return f"{self._instance}-{self._buffer.generation}"
+
+    def _resume_generation(self, last_event_id: str | None) -> int | None:
+        """
+        last_event_id がこのプロセスの現存する世代を指していればその世代を、そうでなければ None を返す。
+        呼び出し側で _lock を保持していること。
+        """
+        instance, _, generation = (last_event_id or "").partition("-")
+        if instance != self._instance or not generation.isdigit():
+            return None
+        generation = int(generation)
+        return generation if generation <= self._buffer.generation else None
+
+    def _snapshot(self) -> tuple[int, str | None, tuple[np.ndarray, ...] | None]:
+        """
+        直近7日分のスナップショットを (世代, キャッシュ済みJSON, 列のコピー) で返す。
+        JSON 化はロック外で行うため、キャッシュがなければ小さな数値列だけをコピーする。
+        呼び出し側で _lock を保持していること。
+        """
+        generation = self._buffer.generation
+        if self._payload_generation == generation:
+            return generation, self._payload, None
+
+        # 世代ごとに結果が決まるよう、現在時刻ではなく最新データの時刻から7日分とする
+        last_ts = self._buffer.last_timestamp
+        start = None if last_ts is None else last_ts - pd.Timedelta(SPACE_WEATHER_WINDOW).value
+        return generation, None, tuple(column.copy() for column in self._buffer.window(start=start))
+
+    def _serialize(self, snapshot: tuple[int, str | None, tuple[np.ndarray, ...] | None]) -> str:
+        generation, payload, columns = snapshot
+        if payload is not None:
+            return payload
+
+        payload = dump_space_weather(*columns)
+        with self._lock:
+            if generation == self._buffer.generation:
+                self._payload, self._payload_generation = payload, generation
+        return payload
+
+    def _run(self, attempted: threading.Event) -> None:
+        # 起動直後は待たずに、停止中の差分 (初回は7日分) を読み込む
+        refresh = True
+        while True:
+            if refresh:
+                self._refresh()
+                attempted.set()
+            refresh = self._wait_for_ingestion()
+
+            with self._lock:
+                if not self._subscribers and time.monotonic() - self._last_access > self.IDLE_TIMEOUT:
+                    # 誰も見ていないので BigQuery への問い合わせをやめる
+                    self._thread = None
+                    connections["default"].close()
+                    return
+
+    def _refresh(self) -> None:
+        """BigQuery から差分を読み込んでバッファに反映し、購読者に配信する。ロックは取得中のみ保持する。"""
+        with self._lock:
+            last_ts = self._buffer.last_timestamp
+        self._last_refresh = time.monotonic()
+
+        try:
+            df, since = self._fetch(last_ts)
+            with self._lock:
+                self._publish(self._ingest(df, since))
+                self._loaded = True
+                self._last_error = None
+        except Exception as e:
+            # 想定外のデータでもスレッドは止めず、次の取り込みで読み直す
+            logger.exception("Error refreshing space weather data")
+            self._last_error = e
+
+    def _fetch(self, last_ts: int | None) -> tuple[pd.DataFrame, int | None]:
+        """
+        保持中の最新時刻から OVERLAP だけ遡った時刻以降 (未取得なら直近7日分) を取得し、
+        (DataFrame, 読み直しの起点 [UTCエポックns]) を返す。
+        """
+        if last_ts is None:
+            return fetch_space_weather(), None
+
+        since = last_ts - pd.Timedelta(self.OVERLAP).value
+        return fetch_space_weather(since=pd.Timestamp(since, tz="UTC").to_pydatetime()), since
+
+    def _ingest(self, df: pd.DataFrame, since: int | None) -> str | None:
+        """
+        取得した行をバッファに反映し、変化したデータ点の JSON を返す (変化なしなら None)。
+        読み直し範囲の Kp 指数は、起点より前の値から ffill し直す。
+        呼び出し側で _lock を保持していること。
+        """
+        last_kp = None if since is None else self._buffer.value_before(since, "kp_index")
+        timestamps, values = pivot_space_weather(df, last_kp=last_kp)
+        changed = self._buffer.merge(timestamps, values)
+        if not len(changed):
+            return None
+
+        return dump_space_weather(*(column[changed] for column in self._buffer.window()))
+
+    def _publish(self, points: str | None) -> None:
+        """
+        変化したデータ点を全購読者に配信する。
+        呼び出し側で _lock を保持していること。
+        """
+        if points is None:
+            return
+        event_id = self._event_id()
+        for subscription in list(self._subscribers):
+            subscription.push(event_id, points)
+            if subscription.closed:
+                self._subscribers.remove(subscription)
+
+    def _wait_for_ingestion(self) -> bool:
+        """
+        次の取り込みまで最大 POLL_INTERVAL 秒待ち、BigQuery を読み直すべきかを返す。
+        PostgreSQL では NOTIFY が届いたときのみ True (未読み込み、または FALLBACK_INTERVAL 秒
+        読み直していない場合も True)。それ以外 (SQLite等) は毎回 True のポーリングになる。
+        """
+        connection = connections["default"]
+        if connection.vendor != "postgresql":
+            time.sleep(self.POLL_INTERVAL)
+            return True
+
+        try:
+            with connection.cursor() as cursor:
+                cursor.execute(f"LISTEN {SPACE_WEATHER_CHANNEL}")
+            # psycopg3 の Connection から通知を1件(またはタイムアウトまで)待つ
+            notified = any(True for _ in connection.connection.notifies(timeout=self.POLL_INTERVAL, stop_after=1))
+        except Exception:
+            logger.exception("Error waiting for space weather notification")
+            connection.close()
+            time.sleep(self.POLL_INTERVAL)
+            return True
+
+        return notified or not self._loaded or time.monotonic() - self._last_refresh > self.FALLBACK_INTERVAL
+
+
+space_weather_hub = SpaceWeatherHub()
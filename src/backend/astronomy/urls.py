@@ -6,4 +6,5 @@ from .views import SolarSystemEphemerisView
 urlpatterns = [
     path("positions/", SolarSystemEphemerisView.as_view(), name="solar-positions"),
     path("space-weather/", views.space_weather_list, name="space_weather_list"),
+    path("space-weather/stream/", views.space_weather_stream, name="space_weather_stream"),
 ]
@@ -1,17 +1,28 @@
+import json
+import queue
+import time
 from datetime import datetime, timedelta
 from zoneinfo import ZoneInfo
 
-import pandas as pd
-from django.conf import settings
-from django.http import JsonResponse
+from django.http import HttpResponse, JsonResponse, StreamingHttpResponse
+from django.views.decorators.http import require_GET
 from drf_spectacular.utils import OpenApiParameter, extend_schema
-from google.cloud import bigquery
 from rest_framework import serializers, status
 from rest_framework.decorators import api_view
 from rest_framework.response import Response
 from rest_framework.views import APIView
 
-from .services import OrbitalCalculator
+from .services import OrbitalCalculator, TooManyStreamsError, space_weather_hub
+
+# 無通信でプロキシに切断されないよう、この秒数ごとにコメント行を送る
+SSE_KEEPALIVE_INTERVAL = 15
+
+# 1接続がスレッドを占有し続けないよう、この秒数で配信を終える
+# (EventSource は Last-Event-ID 付きで自動再接続し、差分だけを受け取る)
+SSE_MAX_DURATION = 600
+
+# 同時接続数の上限に達したときに返す Retry-After [秒] (フロントエンドの再接続間隔と合わせる)
+SSE_RETRY_AFTER = 30
 
 
 class PlanetCoordinatesSerializer(serializers.Serializer):
@@ -28,13 +39,34 @@ class SolarSystemEphemerisView(APIView):
     """
     指定期間の太陽系惑星座標(x, y in AU)を取得する。
     太陽中心・黄道座標系。
+    stream=ndjson / stream=sse を指定すると、チャンクごとに逐次返す。
     """
 
+    # stream パラメータ -> Content-Type
+    STREAM_CONTENT_TYPES = {
+        "ndjson": "application/x-ndjson",
+        "sse": "text/event-stream",
+    }
+
+    def perform_content_negotiation(self, request, force=False):
+        # stream 指定時は StreamingHttpResponse を直接返すので、Accept: text/event-stream や
+        # application/x-ndjson でも 406 にせず、エラー応答用に既定のレンダラーを使う
+        if "stream" in request.query_params:
+            force = True
+        return super().perform_content_negotiation(request, force=force)
+
     @extend_schema(
         parameters=[
             OpenApiParameter(name="start_date", description="開始日 (ISO8601, default: now)", required=False, type=str),
             OpenApiParameter(name="days", description="取得期間の日数 (default: 365)", required=False, type=int),
             OpenApiParameter(name="steps", description="データ点数 (default: 100)", required=False, type=int),
+            OpenApiParameter(
+                name="stream",
+                description="ストリーミング形式 (ndjson | sse)。指定時は timestamps/bodies をチャンク単位で返す",
+                required=False,
+                type=str,
+                enum=["ndjson", "sse"],
+            ),
         ],
         responses={200: SolarSystemResponseSerializer},
     )
@@ -43,6 +75,10 @@ class SolarSystemEphemerisView(APIView):
         start_str = request.query_params.get("start_date")
         days = int(request.query_params.get("days", 365))
         steps = int(request.query_params.get("steps", 100))
+        stream = request.query_params.get("stream")
+
+        if stream and stream not in self.STREAM_CONTENT_TYPES:
+            return Response({"error": "Invalid stream format"}, status=status.HTTP_400_BAD_REQUEST)
 
         # 期間設定
         tz = ZoneInfo("UTC")
@@ -58,6 +94,16 @@ class SolarSystemEphemerisView(APIView):
 
         end_dt = start_dt + timedelta(days=days)
 
+        if stream:
+            response = StreamingHttpResponse(
+                self._stream_positions(stream, start_dt, end_dt, steps),
+                content_type=self.STREAM_CONTENT_TYPES[stream],
+            )
+            # プロキシ(nginx等)でバッファリングされると逐次配信にならないため無効化
+            response["Cache-Control"] = "no-cache"
+            response["X-Accel-Buffering"] = "no"
+            return response
+
         # 計算実行
         try:
             calculator = OrbitalCalculator()
@@ -67,61 +113,95 @@ class SolarSystemEphemerisView(APIView):
             # 本番ではロギングを行う
             return Response({"error": str(e)}, status=status.HTTP_500_INTERNAL_SERVER_ERROR)
 
+    def _stream_positions(self, stream: str, start_dt: datetime, end_dt: datetime, steps: int):
+        """
+        座標をチャンクごとに計算し、NDJSON の1行 / SSE の1イベントとして順に返す。
+        レスポンス開始後はステータスコードを変えられないため、エラーも1チャンクとして送る。
+        """
+        try:
+            calculator = OrbitalCalculator()
+            for chunk in calculator.iter_positions(start_dt, end_dt, steps):
+                yield self._format_chunk(stream, chunk)
+        except Exception as e:
+            yield self._format_chunk(stream, {"error": str(e)}, event="error")
+            return
+
+        if stream == "sse":
+            # クライアントが再接続せずに閉じられるよう終端イベントを送る
+            yield self._format_chunk(stream, {}, event="end")
+
+    @staticmethod
+    def _format_chunk(stream: str, payload: dict, event: str | None = None) -> str:
+        body = json.dumps(payload, separators=(",", ":"))
+        if stream == "ndjson":
+            return body + "\n"
+        prefix = f"event: {event}\n" if event else ""
+        return f"{prefix}data: {body}\n\n"
+
 
 @api_view(["GET"])
 def space_weather_list(request):
     """
-    BigQueryから直近7日間の宇宙天気データを取得し、
-    グラフ描画用に整形して返すAPI
+    直近7日間の宇宙天気データを、グラフ描画用に整形して返すAPI。
+    BigQuery へは毎回問い合わせず、SpaceWeatherHub のプロセス内バッファから返す。
     """
     try:
-        client = bigquery.Client()
-
-        # SQL: 直近7日間のデータを取得
-        # データがまだ少ない場合やUTCのズレを考慮して少し広めに取るか、LIMITをつけるのも手です
-        query = f"""
-            SELECT timestamp, metric, value
-            FROM `{settings.GOOGLE_CLOUD_PROJECT}.celestial_biome_data.space_weather_metrics`
-            WHERE timestamp >= TIMESTAMP_SUB(CURRENT_TIMESTAMP(), INTERVAL 7 DAY)
-            ORDER BY timestamp ASC
-        """
-
-        query_job = client.query(query)
-        rows = query_job.result()
-        df = rows.to_dataframe()
-
-        if df.empty:
-            return JsonResponse([], safe=False)
+        # JSON はバッファの更新ごとにキャッシュされているので、そのまま返す
+        return HttpResponse(space_weather_hub.recent(), content_type="application/json")
 
-        # ---------------------------------------------------------
-        # データ整形 (Long Format -> Wide Format)
-        # ---------------------------------------------------------
-        # 1. 重複排除: 同じ時刻・同じ指標なら平均をとる
-        df = df.groupby(["timestamp", "metric"])["value"].mean().reset_index()
-
-        # 2. Pivot: 行=時刻, 列=指標, 値=value
-        pivoted = df.pivot(index="timestamp", columns="metric", values="value")
-
-        if "kp_index" in pivoted.columns:
-            # Kp指数は3時間ごとなので、間の1分刻みのデータは直前の値で埋める(ffill)
-            pivoted["kp_index"] = pivoted["kp_index"].ffill()
-            # データの先頭がnullの場合に備えて0埋め等はせず、描画時に任せます
-
-        # 3. index(timestamp) を列に戻す
-        pivoted.reset_index(inplace=True)
-
-        # 4. timestampを文字列(ISO format)に変換 (JSON化のため)
-        pivoted["timestamp"] = pivoted["timestamp"].apply(lambda x: x.isoformat())
-
-        # 5. NaN (欠損値) を None に置換 (JSONのnullになる)
-        # astype(object) を追加して、確実に None が入るようにします
-        pivoted = pivoted.astype(object).where(pd.notnull(pivoted), None)
-
-        # 6. リスト形式の辞書に変換
-        data = pivoted.to_dict(orient="records")
+    except Exception as e:
+        print(f"Error fetching BigQuery data: {e}")
+        return JsonResponse({"error": str(e)}, status=500)
 
-        return JsonResponse(data, safe=False)
 
+# EventSource の Accept: text/event-stream を DRF のコンテンツネゴシエーションで
+# 弾かないよう、素の Django ビューとして定義する
+@require_GET
+def space_weather_stream(request):
+    """
+    宇宙天気データの Server-Sent Events 配信。
+    接続時に直近7日分を snapshot イベントで送り、以降は変化した
+    データ点のみを update イベントで送る。各イベントにはバッファの世代を id として付け、
+    Last-Event-ID 付きの再接続では snapshot の代わりにそれ以降の変化分だけを update で送る。
+    同時接続数は settings.SPACE_WEATHER_MAX_STREAMS までで、超えた分は 503 を返す。
+    """
+    # ブラウザの自動再接続はヘッダーで、作り直した EventSource はクエリで前回のイベントIDを送ってくる
+    last_event_id = request.headers.get("Last-Event-ID") or request.GET.get("last_event_id")
+    try:
+        subscription = space_weather_hub.subscribe(last_event_id)
+    except TooManyStreamsError as e:
+        # 同時接続数の上限。クライアントは時間をおいて再接続する
+        response = JsonResponse({"error": str(e)}, status=503)
+        response["Retry-After"] = str(SSE_RETRY_AFTER)
+        return response
     except Exception as e:
         print(f"Error fetching BigQuery data: {e}")
         return JsonResponse({"error": str(e)}, status=500)
+
+    response = StreamingHttpResponse(_space_weather_events(subscription), content_type="text/event-stream")
+    response["Cache-Control"] = "no-cache"
+    response["X-Accel-Buffering"] = "no"
+    return response
+
+
+def _space_weather_events(subscription):
+    deadline = time.monotonic() + SSE_MAX_DURATION
+    try:
+        if subscription.snapshot is not None:
+            yield _sse_event("snapshot", subscription.snapshot, subscription.event_id)
+        elif subscription.resume is not None:
+            yield _sse_event("update", subscription.resume, subscription.event_id)
+        while not subscription.closed and time.monotonic() < deadline:
+            try:
+                event_id, points = subscription.get(timeout=SSE_KEEPALIVE_INTERVAL)
+            except queue.Empty:
+                yield ": keep-alive\n\n"
+                continue
+            yield _sse_event("update", points, event_id)
+    finally:
+        # クライアント切断時 (GeneratorExit) も購読を解除する
+        space_weather_hub.unsubscribe(subscription)
+
+
+def _sse_event(event: str, data: str, event_id: str) -> str:
+    return f"id: {event_id}\nevent: {event}\ndata: {data}\n\n"
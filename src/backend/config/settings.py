@@ -169,3 +169,7 @@ SPECTACULAR_SETTINGS = {
 
 # コンテナ環境変数名に合わせる
 GOOGLE_CLOUD_PROJECT = os.getenv("GOOGLE_CLOUD_PROJECT")
+
+# 宇宙天気 SSE の同時接続数の上限 (プロセスごと)
+# 1接続が gunicorn のスレッドを1本占有するので、通常のAPI用にスレッドが残る値にする (Dockerfile は 8 スレッド)
+SPACE_WEATHER_MAX_STREAMS = int(os.getenv("SPACE_WEATHER_MAX_STREAMS", "4"))
@@ -38,6 +38,21 @@ export async function GET(
       );
     }
 
+    // ストリーミング応答 (NDJSON / SSE) はバッファせずそのまま中継する
+    const contentType = res.headers.get('Content-Type') ?? '';
+    if (
+      contentType.startsWith('application/x-ndjson') ||
+      contentType.startsWith('text/event-stream')
+    ) {
+      return new Response(res.body, {
+        headers: {
+          'Content-Type': contentType,
+          'Cache-Control': 'no-cache',
+          'X-Accel-Buffering': 'no',
+        },
+      });
+    }
+
     const data = await res.json();
 
     // 5. フロントエンドへ結果を返す
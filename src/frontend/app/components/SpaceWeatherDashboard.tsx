@@ -19,28 +19,84 @@ type WeatherData = {
   kp_index?: number;
 };
 
+// 同時接続数の上限 (503) で切断されたときに再接続するまでの間隔。
+// EventSource からはレスポンスヘッダーを読めないため、バックエンドの Retry-After (SSE_RETRY_AFTER) と合わせる
+const RETRY_DELAY_MS = 30 * 1000;
+
+// 遅れて届いた指標で既存の時刻が更新されることがあるので、時刻をキーに上書きする
+function mergePoints(prev: WeatherData[], points: WeatherData[]): WeatherData[] {
+  if (!points.length) return prev;
+
+  const byTimestamp = new Map(prev.map((p) => [p.timestamp, p]));
+  for (const p of points) byTimestamp.set(p.timestamp, p);
+  const merged = [...byTimestamp.values()].sort((a, b) => a.timestamp.localeCompare(b.timestamp));
+
+  // 最新データから7日より古いデータ点は捨てる
+  const cutoff = new Date(merged[merged.length - 1].timestamp).getTime() - 7 * 24 * 60 * 60 * 1000;
+  return merged.filter((p) => new Date(p.timestamp).getTime() >= cutoff);
+}
+
 export default function SpaceWeatherDashboard() {
   const [data, setData] = useState<WeatherData[]>([]);
   const [loading, setLoading] = useState(true);
 
   useEffect(() => {
-    const fetchData = async () => {
-      try {
-        // 環境変数経由のAPI URL、またはローカルプロキシ
-        const apiUrl = process.env.NEXT_PUBLIC_API_URL || 'http://localhost:8000';
-        const res = await fetch(`${apiUrl}/api/v1/astronomy/space-weather/`);
+    // 環境変数経由のAPI URL、またはローカルプロキシ
+    const apiUrl = process.env.NEXT_PUBLIC_API_URL || 'http://localhost:8000';
+    let source: EventSource | null = null;
+    let retryTimer: ReturnType<typeof setTimeout> | undefined;
+    let lastEventId = '';
+    let listFetched = false;
+
+    const connect = () => {
+      // 接続時に直近7日分 (snapshot)、以降は変化したデータ点のみ (update) が届く。
+      // 作り直した EventSource は Last-Event-ID を送らないので、クエリで引き継いで差分だけを受け取る
+      const query = lastEventId ? `?last_event_id=${encodeURIComponent(lastEventId)}` : '';
+      const es = new EventSource(`${apiUrl}/api/v1/astronomy/space-weather/stream/${query}`);
+      source = es;
 
-        if (!res.ok) throw new Error('Failed to fetch data');
+      es.addEventListener('snapshot', (event) => {
+        const message = event as MessageEvent;
+        lastEventId = message.lastEventId;
+        setData(JSON.parse(message.data));
+        setLoading(false);
+      });
+
+      es.addEventListener('update', (event) => {
+        const message = event as MessageEvent;
+        lastEventId = message.lastEventId;
+        const points: WeatherData[] = JSON.parse(message.data);
+        setData((prev) => mergePoints(prev, points));
+        setLoading(false);
+      });
 
-        const jsonData = await res.json();
-        setData(jsonData);
-      } catch (err) {
+      es.onerror = async (err) => {
+        // 通常は EventSource が自動で再接続し、Last-Event-ID 以降の差分を受け取り直す
         console.error(err);
-      } finally {
+        if (es.readyState === EventSource.CLOSED) {
+          // 同時接続数の上限 (503) などで再接続しない場合は、まだデータがなければ一覧APIで取得し、
+          // 時間をおいて接続し直す
+          if (!lastEventId && !listFetched) {
+            listFetched = true;
+            try {
+              const res = await fetch(`${apiUrl}/api/v1/astronomy/space-weather/`);
+              if (res.ok) setData(await res.json());
+            } catch (fetchErr) {
+              console.error(fetchErr);
+            }
+          }
+          retryTimer = setTimeout(connect, RETRY_DELAY_MS);
+        }
         setLoading(false);
-      }
+      };
+    };
+
+    connect();
+
+    return () => {
+      clearTimeout(retryTimer);
+      source?.close();
     };
-    fetchData();
   }, []);
 
   if (loading) return <div className="text-white p-4">Loading Space Weather Data...</div>;